@@ -6,6 +6,24 @@ WEBDAV_PASSWORD=${WEBDAV_PASSWORD:-admin}
 PUID=${PUID:-1000}
 PGID=${PGID:-1000}
 PORT=${PORT:-80}
+PUBLIC_PREFIX=${PUBLIC_PREFIX:-/webdav}
+CACHE_SIZE=${CACHE_SIZE:-0}
+CACHE_MAX_ENTRY_SIZE=${CACHE_MAX_ENTRY_SIZE:-65536}
+CACHE_TTL=${CACHE_TTL:-60}
+TRASH_ENABLED=${TRASH_ENABLED:-false}
+TRASH_RETENTION=${TRASH_RETENTION:-604800}
+TRASH_PURGE_INTERVAL=${TRASH_PURGE_INTERVAL:-60}
+TRASH_PURGE_SLICE=${TRASH_PURGE_SLICE:-1}
+TRASH_PURGE_PAUSE=${TRASH_PURGE_PAUSE:-4}
+REDIS_HOST=${REDIS_HOST:-}
+REDIS_PORT=${REDIS_PORT:-6379}
+REDIS_PASSWORD=${REDIS_PASSWORD:-}
+
+# Settings read by the Lua modules in nginx and by trash-purge.sh
+export PUBLIC_PREFIX
+export CACHE_SIZE CACHE_MAX_ENTRY_SIZE CACHE_TTL
+export TRASH_ENABLED TRASH_RETENTION TRASH_PURGE_INTERVAL TRASH_PURGE_SLICE TRASH_PURGE_PAUSE
+export REDIS_HOST REDIS_PORT REDIS_PASSWORD
 
 # Remove default nginx user/group created during image build
 deluser nginx 2>/dev/null || true
@@ -40,6 +58,29 @@ sed -i "1s/^user .*;/user $NGINX_USER $NGINX_GROUP;/" /etc/nginx/nginx.conf
 # Update nginx port in config
 sed -i "s/listen 80;/listen $PORT;/" /etc/nginx/nginx.conf
 
+# Update micro-cache size in config (0 keeps the cache disabled)
+if [ "$CACHE_SIZE" != "0" ]; then
+    sed -i "s/lua_shared_dict webdav_cache [^;]*;/lua_shared_dict webdav_cache $CACHE_SIZE;/" /etc/nginx/nginx.conf
+fi
+
+# Use the container's name server to look up REDIS_HOST
+if [ -n "$REDIS_HOST" ]; then
+    RESOLVER=$(awk '/^nameserver/ { print $2; exit }' /etc/resolv.conf)
+    case "$RESOLVER" in
+        *:*) RESOLVER="[$RESOLVER]" ;;
+    esac
+    if [ -n "$RESOLVER" ]; then
+        sed -i "s/resolver [^ ;]*/resolver $RESOLVER/" /etc/nginx/nginx.conf
+    fi
+fi
+
+# Trash lives on the volume itself so DELETE can be a plain rename
+if [ "$TRASH_ENABLED" = "true" ]; then
+    mkdir -p /var/www/webdav/.trash
+    chown "$PUID:$PGID" /var/www/webdav/.trash
+    /usr/local/bin/trash-purge.sh &
+fi
+
 # Always regenerate htpasswd file on startup
 echo "Creating htpasswd file for user: $WEBDAV_USERNAME"
 htpasswd -bc /etc/nginx/.htpasswd "$WEBDAV_USERNAME" "$WEBDAV_PASSWORD"
@@ -47,6 +88,15 @@ htpasswd -bc /etc/nginx/.htpasswd "$WEBDAV_USERNAME" "$WEBDAV_PASSWORD"
 echo "Starting WebDAV server with Nginx..."
 echo "Nginx user: $NGINX_USER (UID:GID = $PUID:$PGID)"
 echo "Port: $PORT"
+if [ "$CACHE_SIZE" != "0" ]; then
+    echo "Micro-cache: $CACHE_SIZE (max entry $CACHE_MAX_ENTRY_SIZE bytes, TTL ${CACHE_TTL}s)"
+fi
+if [ "$TRASH_ENABLED" = "true" ]; then
+    echo "Trash: enabled (retention ${TRASH_RETENTION}s)"
+fi
+if [ -n "$REDIS_HOST" ]; then
+    echo "Cluster mode: Redis at $REDIS_HOST:$REDIS_PORT"
+fi
 echo "WebDAV username: $WEBDAV_USERNAME"
 echo "WebDAV URL: http://localhost:$PORT/webdav"
 
@@ -0,0 +1,419 @@
+-- In-memory micro-cache for small, frequently fetched files.
+--
+-- File bodies are kept in the "webdav_cache" shared dict, which evicts the
+-- least recently used entries when full, and are served from the access
+-- phase after auth_basic has run. Hit/miss counters live in a separate
+-- dict so they are never evicted along with the bodies. Each body is
+-- stored with its mtime so responses carry the same ETag and Last-Modified
+-- as nginx's static handler, and conditional GETs get a 304.
+--
+-- Every invalidation bumps a generation counter. A miss reads it before
+-- stat() and drops the entry it has just stored if it changed, so a GET
+-- that read the old file while another worker completed a write cannot
+-- leave the old body cached.
+--
+-- In cluster mode (see webdav_redis.lua) every replica keeps its own
+-- cache. Invalidations are published on a Redis channel that one worker
+-- per replica subscribes to, and counters are added up in Redis.
+
+local ngx = ngx
+local io_open = io.open
+local os_getenv = os.getenv
+local tonumber = tonumber
+local tostring = tostring
+local ipairs = ipairs
+local string_format = string.format
+
+local bit = require "bit"
+local ffi = require "ffi"
+local redis = require "webdav_redis"
+
+local _M = {}
+
+local cache = ngx.shared.webdav_cache
+local stats = ngx.shared.webdav_cache_stats
+
+local enabled = false
+local max_entry_size = 65536
+local ttl = 60
+
+local channel = redis.key("cache:invalidate")
+local counters = { "hits", "misses" }
+
+-- struct stat as laid out by musl on the architectures the image is built for
+local stat_layouts = {
+    x64 = [[
+        struct webdav_stat {
+            uint64_t st_dev;
+            uint64_t st_ino;
+            uint64_t st_nlink;
+            uint32_t st_mode;
+            uint32_t st_uid;
+            uint32_t st_gid;
+            uint32_t __pad0;
+            uint64_t st_rdev;
+            int64_t st_size;
+            int64_t st_blksize;
+            int64_t st_blocks;
+            int64_t st_atime;
+            int64_t st_atime_nsec;
+            int64_t st_mtime;
+            int64_t st_mtime_nsec;
+            int64_t st_ctime;
+            int64_t st_ctime_nsec;
+            int64_t __unused[3];
+        };
+    ]],
+    arm64 = [[
+        struct webdav_stat {
+            uint64_t st_dev;
+            uint64_t st_ino;
+            uint32_t st_mode;
+            uint32_t st_nlink;
+            uint32_t st_uid;
+            uint32_t st_gid;
+            uint64_t st_rdev;
+            uint64_t __pad1;
+            int64_t st_size;
+            int32_t st_blksize;
+            int32_t __pad2;
+            int64_t st_blocks;
+            int64_t st_atime;
+            int64_t st_atime_nsec;
+            int64_t st_mtime;
+            int64_t st_mtime_nsec;
+            int64_t st_ctime;
+            int64_t st_ctime_nsec;
+            uint32_t __unused[2];
+        };
+    ]],
+}
+
+local stat_buf
+
+local S_IFMT = 0xF000
+local S_IFREG = 0x8000
+
+local mime_types = {}
+local default_type = "application/octet-stream"
+
+-- Methods that change the content behind a URI (and Destination)
+local invalidating = {
+    PUT = true,
+    DELETE = true,
+    MOVE = true,
+    COPY = true,
+}
+
+-- Build an extension -> MIME type map from nginx's own mime.types
+local function load_mime_types(path)
+    local f = io_open(path, "r")
+    if not f then
+        return
+    end
+    local data = f:read("*a")
+    f:close()
+
+    data = data:gsub("#[^\n]*", ""):gsub("^%s*types%s*{", ""):gsub("}%s*$", "")
+    for entry in data:gmatch("([^;]+);") do
+        local ctype
+        for token in entry:gmatch("%S+") do
+            if ctype then
+                mime_types[token:lower()] = ctype
+            else
+                ctype = token
+            end
+        end
+    end
+end
+
+local function content_type(uri)
+    local ext = uri:match("%.([^./]+)$")
+    return ext and mime_types[ext:lower()] or default_type
+end
+
+local function invalidate(uri)
+    stats:incr("gen", 1, 0)
+    if uri:byte(-1) == 47 then
+        -- A collection may hold any number of cached descendants
+        cache:flush_all()
+    else
+        cache:delete(uri)
+    end
+end
+
+local function publish(premature, uris)
+    if premature then
+        return
+    end
+
+    local red, err = redis.connect()
+    if not red then
+        ngx.log(ngx.WARN, "micro-cache: cannot publish invalidation: ", err)
+        return
+    end
+    red:init_pipeline()
+    for _, uri in ipairs(uris) do
+        red:publish(channel, uri)
+    end
+    red:commit_pipeline()
+    redis.release(red)
+end
+
+local function invalidate_request(method, broadcast)
+    local uri = ngx.var.uri
+    invalidate(uri)
+
+    local dest
+    if method == "MOVE" or method == "COPY" then
+        -- Decoded and normalized by webdav_path in the rewrite phase
+        dest = ngx.ctx.webdav_destination
+        if dest then
+            invalidate(dest)
+        end
+    end
+
+    if broadcast and redis.enabled then
+        local ok, err = ngx.timer.at(0, publish, { uri, dest })
+        if not ok then
+            ngx.log(ngx.ERR, "micro-cache: cannot publish invalidation of ", uri, ": ", err)
+        end
+    end
+end
+
+-- Apply invalidations published by other replicas; runs in one worker
+local function subscribe(premature)
+    if premature or ngx.worker.exiting() then
+        return
+    end
+
+    local red, err = redis.connect()
+    if red then
+        local ok
+        ok, err = red:subscribe(channel)
+        if ok then
+            -- Anything published while disconnected has been missed
+            invalidate("/")
+            while not ngx.worker.exiting() do
+                local res
+                res, err = red:read_reply()
+                if res then
+                    if res[1] == "message" then
+                        invalidate(res[3])
+                    end
+                elseif err ~= "timeout" then
+                    break
+                end
+                err = nil
+            end
+        end
+        -- Subscribed connections cannot go back to the pool
+        red:close()
+    end
+
+    if err then
+        ngx.log(ngx.WARN, "micro-cache: invalidation channel: ", err)
+    end
+    if not ngx.worker.exiting() then
+        local ok
+        ok, err = ngx.timer.at(1, subscribe)
+        if not ok then
+            ngx.log(ngx.ERR, "micro-cache: cannot resubscribe to invalidations: ", err)
+        end
+    end
+end
+
+-- Add this replica's counters to the cluster-wide totals in Redis
+local function push_counters(premature)
+    if premature then
+        return
+    end
+
+    local red = redis.connect()
+    if not red then
+        return
+    end
+    for _, name in ipairs(counters) do
+        local value = stats:get(name) or 0
+        local pushed = stats:get(name .. ":pushed") or 0
+        if value > pushed and red:incrby(redis.key("cache:" .. name), value - pushed) then
+            stats:set(name .. ":pushed", value)
+        end
+    end
+    redis.release(red)
+end
+
+-- Return size and mtime of a regular file, or nil
+local function stat(path)
+    if ffi.C.stat(path, stat_buf) ~= 0
+        or bit.band(stat_buf.st_mode, S_IFMT) ~= S_IFREG
+    then
+        return nil
+    end
+    return tonumber(stat_buf.st_size), tonumber(stat_buf.st_mtime)
+end
+
+-- Same rules as nginx's not_modified filter with "if_modified_since exact"
+local function not_modified(etag, mtime)
+    local inm = ngx.var.http_if_none_match
+    if inm then
+        return inm == "*" or inm:find(etag, 1, true) ~= nil
+    end
+    local ims = ngx.var.http_if_modified_since
+    return ims ~= nil and ngx.parse_http_time(ims) == mtime
+end
+
+local function send(entry, mtime)
+    local sep = entry:find("\n", 1, true)
+    local size = #entry - sep
+    local etag = string_format('"%x-%x"', mtime, size)
+
+    ngx.header["ETag"] = etag
+    ngx.header["Last-Modified"] = ngx.http_time(mtime)
+    if not_modified(etag, mtime) then
+        ngx.status = ngx.HTTP_NOT_MODIFIED
+        return ngx.exit(ngx.HTTP_NOT_MODIFIED)
+    end
+
+    ngx.status = ngx.HTTP_OK
+    ngx.header["Content-Type"] = entry:sub(1, sep - 1)
+    ngx.header["Content-Length"] = size
+    ngx.header["Accept-Ranges"] = "bytes"
+    ngx.print(entry:sub(sep + 1))
+    return ngx.exit(ngx.HTTP_OK)
+end
+
+-- Read settings exported by entrypoint.sh; runs once in init_by_lua
+function _M.init()
+    local size = os_getenv("CACHE_SIZE")
+    enabled = size ~= nil and size ~= "" and size ~= "0"
+    max_entry_size = tonumber(os_getenv("CACHE_MAX_ENTRY_SIZE")) or max_entry_size
+    ttl = tonumber(os_getenv("CACHE_TTL")) or ttl
+
+    if not enabled then
+        return
+    end
+
+    local layout = stat_layouts[ffi.arch]
+    if not layout then
+        ngx.log(ngx.WARN, "micro-cache: disabled, unsupported architecture ", ffi.arch)
+        enabled = false
+        return
+    end
+    ffi.cdef(layout)
+    ffi.cdef("int stat(const char *path, struct webdav_stat *buf);")
+    stat_buf = ffi.new("struct webdav_stat")
+
+    load_mime_types("/etc/nginx/mime.types")
+end
+
+function _M.init_worker()
+    if not enabled or not redis.enabled or ngx.worker.id() ~= 0 then
+        return
+    end
+
+    ngx.timer.at(0, subscribe)
+    ngx.timer.every(1, push_counters)
+end
+
+function _M.access()
+    if not enabled then
+        return
+    end
+
+    local method = ngx.req.get_method()
+    if method ~= "GET" then
+        if invalidating[method] then
+            -- Only writes that got past auth_basic reach this point
+            ngx.ctx.webdav_cache_write = true
+            invalidate_request(method, false)
+        end
+        return
+    end
+
+    -- Directory listings, partial and precondition requests go to nginx
+    -- as usual
+    local uri = ngx.var.uri
+    if uri:byte(-1) == 47 or ngx.var.http_range or ngx.var.http_if_match
+        or ngx.var.http_if_unmodified_since
+    then
+        return
+    end
+
+    -- The mtime is kept in the entry's flags
+    local entry, mtime = cache:get(uri)
+    if entry then
+        stats:incr("hits", 1, 0)
+        return send(entry, mtime)
+    end
+    stats:incr("misses", 1, 0)
+
+    local gen = stats:get("gen")
+    local path = ngx.var.request_filename
+    local size
+    size, mtime = stat(path)
+    if not size or size > max_entry_size then
+        return
+    end
+
+    local f = io_open(path, "rb")
+    if not f then
+        return
+    end
+    local body = f:read("*a")
+    f:close()
+    if not body or #body ~= size then
+        -- Changed while being read; let nginx serve it this time
+        return
+    end
+
+    entry = content_type(uri) .. "\n" .. body
+    cache:set(uri, entry, ttl, mtime)
+    if stats:get("gen") ~= gen then
+        -- Invalidated while being read, possibly by a completed write
+        cache:delete(uri)
+    end
+    return send(entry, mtime)
+end
+
+-- Invalidate again once a write has succeeded, so no GET can fill the
+-- cache from the old file after it, and tell the other replicas. The log
+-- phase also runs for requests rejected by auth_basic, hence the flag.
+function _M.log()
+    if not enabled or not ngx.ctx.webdav_cache_write then
+        return
+    end
+
+    local status = ngx.status
+    if status >= 200 and status < 300 then
+        invalidate_request(ngx.req.get_method(), true)
+    end
+end
+
+function _M.status()
+    ngx.header["Content-Type"] = "text/plain"
+    ngx.say("enabled: ", tostring(enabled))
+    ngx.say("hits: ", stats:get("hits") or 0)
+    ngx.say("misses: ", stats:get("misses") or 0)
+    ngx.say("capacity: ", cache:capacity())
+    ngx.say("free_space: ", cache:free_space())
+
+    if not redis.enabled then
+        return
+    end
+    local red, err = redis.connect()
+    if not red then
+        ngx.say("cluster: unavailable (", err, ")")
+        return
+    end
+    for _, name in ipairs(counters) do
+        local value = red:get(redis.key("cache:" .. name))
+        if not value or value == ngx.null then
+            value = 0
+        end
+        ngx.say("cluster_", name, ": ", value)
+    end
+    redis.release(red)
+end
+
+return _M
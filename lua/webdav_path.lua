@@ -0,0 +1,163 @@
+-- Request URI and Destination normalization.
+--
+-- Clients send Destination as a full URL, percent-encoded and sometimes
+-- under the prefix a reverse proxy exposes (PUBLIC_PREFIX) rather than
+-- /webdav. The dav module needs a plain path below /webdav, so MOVE and
+-- COPY get their Destination decoded, resolved ("." and ".." segments,
+-- repeated slashes), mapped back to /webdav and re-encoded. Other methods
+-- return before doing any work. Results are cached per worker.
+
+local ngx = ngx
+local re_find = ngx.re.find
+local re_match = ngx.re.match
+local re_gsub = ngx.re.gsub
+local escape_uri = ngx.escape_uri
+local os_getenv = os.getenv
+local string_char = string.char
+local tonumber = tonumber
+local type = type
+local table_concat = table.concat
+
+local lrucache = require "resty.lrucache"
+
+local _M = {}
+
+local location = "/webdav"
+local public_prefix = location
+
+local destinations = lrucache.new(1024)
+
+-- Methods whose request URI names a new resource
+local creating = {
+    PUT = true,
+    MKCOL = true,
+    MOVE = true,
+    COPY = true,
+}
+
+local function unhex(m)
+    return string_char(tonumber(m[1], 16))
+end
+
+-- ngx.unescape_uri() also turns "+" into a space, which is wrong for paths
+local function unescape_path(path)
+    return (re_gsub(path, [[%([0-9a-fA-F]{2})]], unhex, "jo"))
+end
+
+local function has_control_chars(s)
+    return re_find(s, [=[[\x00-\x1f\x7f]]=], "jo") ~= nil
+end
+
+-- Strip "prefix" from the start of "path" on a segment boundary
+local function strip_prefix(path, prefix)
+    if prefix == "/" then
+        return path
+    end
+    if path:sub(1, #prefix) ~= prefix then
+        return nil
+    end
+    local rest = path:sub(#prefix + 1)
+    if rest == "" or rest:byte(1) == 47 then
+        return rest
+    end
+    return nil
+end
+
+local function resolve(dest)
+    local m = re_match(dest, [[^(?:[a-z][a-z0-9+.-]*://[^/]*)?(/[^?#]*)]], "joi")
+    if not m then
+        return nil, "not an absolute path or URL"
+    end
+
+    local path = unescape_path(m[1])
+    if has_control_chars(path) then
+        return nil, "control characters in path"
+    end
+
+    local rest = strip_prefix(path, public_prefix) or strip_prefix(path, location)
+    if not rest then
+        return nil, "outside of " .. public_prefix
+    end
+
+    local segments = {}
+    local n = 0
+    for segment in rest:gmatch("[^/]+") do
+        if segment == ".." then
+            if n == 0 then
+                return nil, "escapes " .. location
+            end
+            segments[n] = nil
+            n = n - 1
+        elseif segment ~= "." then
+            n = n + 1
+            segments[n] = segment
+        end
+    end
+
+    local trailing = (n > 0 and rest:byte(-1) == 47) and "/" or ""
+    local decoded = location .. "/" .. table_concat(segments, "/") .. trailing
+    for i = 1, n do
+        segments[i] = escape_uri(segments[i])
+    end
+    local encoded = location .. "/" .. table_concat(segments, "/") .. trailing
+
+    return { encoded = encoded, decoded = decoded }
+end
+
+-- Read settings exported by entrypoint.sh; runs once in init_by_lua
+function _M.init()
+    local prefix = os_getenv("PUBLIC_PREFIX")
+    if prefix and prefix ~= "" then
+        public_prefix = "/" .. prefix:gsub("^/+", ""):gsub("/+$", "")
+    end
+end
+
+-- Return the encoded and decoded form of a Destination header, or nil and
+-- an error message if it cannot be mapped below /webdav
+function _M.normalize_destination(dest)
+    local result = destinations:get(dest)
+    if result == nil then
+        local err
+        result, err = resolve(dest)
+        if not result then
+            destinations:set(dest, err)
+            return nil, err
+        end
+        destinations:set(dest, result)
+    elseif type(result) == "string" then
+        return nil, result
+    end
+    return result.encoded, result.decoded
+end
+
+function _M.rewrite()
+    local method = ngx.req.get_method()
+    if not creating[method] then
+        return
+    end
+
+    -- nginx has already decoded and resolved the request URI itself
+    if has_control_chars(ngx.var.uri) then
+        return ngx.exit(ngx.HTTP_BAD_REQUEST)
+    end
+
+    if method ~= "MOVE" and method ~= "COPY" then
+        return
+    end
+
+    local dest = ngx.var.http_destination
+    if not dest then
+        return
+    end
+
+    local encoded, decoded = _M.normalize_destination(dest)
+    if not encoded then
+        ngx.log(ngx.INFO, "invalid Destination \"", dest, "\": ", decoded)
+        return ngx.exit(ngx.HTTP_BAD_REQUEST)
+    end
+
+    ngx.req.set_header("Destination", encoded)
+    ngx.ctx.webdav_destination = decoded
+end
+
+return _M
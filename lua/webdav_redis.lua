@@ -0,0 +1,68 @@
+-- Optional Redis backend for state shared by several replicas.
+--
+-- Enabled by REDIS_HOST. Connections are taken from the cosocket keepalive
+-- pool, so requests and timers reuse idle connections instead of opening
+-- a new one each time. Cosockets are not available in init_by_lua or
+-- log_by_lua; callers in those phases go through ngx.timer.at.
+
+local ngx = ngx
+local os_getenv = os.getenv
+local tonumber = tonumber
+
+local redis = require "resty.redis"
+
+local _M = {
+    enabled = false,
+}
+
+local host
+local port = 6379
+local password
+local prefix = "webdav:"
+
+local timeout = 1000
+local pool_size = 32
+local idle_timeout = 60000
+
+-- Read settings exported by entrypoint.sh; runs once in init_by_lua
+function _M.init()
+    host = os_getenv("REDIS_HOST")
+    _M.enabled = host ~= nil and host ~= ""
+    port = tonumber(os_getenv("REDIS_PORT")) or port
+    password = os_getenv("REDIS_PASSWORD")
+end
+
+function _M.key(name)
+    return prefix .. name
+end
+
+function _M.connect()
+    local red = redis:new()
+    red:set_timeouts(timeout, timeout, timeout)
+
+    local ok, err = red:connect(host, port, { pool_size = pool_size })
+    if not ok then
+        return nil, err
+    end
+
+    -- Pooled connections are already authenticated
+    if password and password ~= "" and red:get_reused_times() == 0 then
+        ok, err = red:auth(password)
+        if not ok then
+            red:close()
+            return nil, err
+        end
+    end
+
+    return red
+end
+
+-- Hand a connection back to the keepalive pool
+function _M.release(red)
+    local ok, err = red:set_keepalive(idle_timeout, pool_size)
+    if not ok then
+        ngx.log(ngx.WARN, "redis: cannot keep connection alive: ", err)
+    end
+end
+
+return _M
@@ -0,0 +1,138 @@
+-- Recycle bin for DELETE.
+--
+-- With TRASH_ENABLED, a DELETE renames its target into the hidden ".trash"
+-- directory at the root of the volume and returns at once, so the cost no
+-- longer grows with the size of the collection. trash-purge.sh removes
+-- expired entries in the background. Entries are named
+-- "<deleted-at>.<host>.<pid>.<seq>~<escaped original path>" and are
+-- restored with a plain WebDAV MOVE out of /webdav/.trash/. The host name
+-- keeps names unique when several replicas share one volume. Deleting an
+-- entry from the trash renames it to ".purging.*" for the background purge
+-- rather than unlinking it in the worker.
+
+local ngx = ngx
+local io_open = io.open
+local os_getenv = os.getenv
+local os_rename = os.rename
+local string_format = string.format
+
+local _M = {}
+
+local enabled = false
+local host = "localhost"
+local seq = 0
+
+local root = "/var/www/webdav/"
+local trash_uri = "/webdav/.trash"
+local trash_dir = root .. ".trash/"
+
+-- Methods allowed inside the trash: browsing, restoring and purging
+local trash_methods = {
+    GET = true,
+    HEAD = true,
+    OPTIONS = true,
+    PROPFIND = true,
+    MOVE = true,
+    DELETE = true,
+}
+
+local function in_trash(uri)
+    if uri:sub(1, #trash_uri) ~= trash_uri then
+        return false
+    end
+    return #uri == #trash_uri or uri:byte(#trash_uri + 1) == 47
+end
+
+local function is_trash_root(uri)
+    return #uri <= #trash_uri + 1
+end
+
+-- ".purging.*" and the purge work directories belong to trash-purge.sh
+local function is_internal(uri)
+    return uri:byte(#trash_uri + 2) == 46
+end
+
+-- fopen() of "path/" only succeeds on a directory
+local function is_dir(path)
+    local f = io_open(path .. "/", "r")
+    if not f then
+        return false
+    end
+    f:close()
+    return true
+end
+
+local function unique_name()
+    seq = seq + 1
+    return string_format("%d.%s.%d.%d", ngx.time(), host, ngx.worker.pid(), seq)
+end
+
+-- Read settings exported by entrypoint.sh; runs once in init_by_lua
+function _M.init()
+    enabled = os_getenv("TRASH_ENABLED") == "true"
+
+    local f = io_open("/etc/hostname", "r")
+    if f then
+        host = f:read("*l") or host
+        f:close()
+    end
+end
+
+function _M.access()
+    if not enabled then
+        return
+    end
+
+    local method = ngx.req.get_method()
+    local uri = ngx.var.uri
+
+    if in_trash(uri) then
+        if not trash_methods[method]
+            or ((method == "MOVE" or method == "DELETE")
+                and (is_trash_root(uri) or is_internal(uri)))
+        then
+            return ngx.exit(ngx.HTTP_FORBIDDEN)
+        end
+    end
+
+    if method == "MOVE" or method == "COPY" then
+        -- Nothing may be put into the trash except by DELETE
+        local dest = ngx.ctx.webdav_destination
+        if dest and in_trash(dest) then
+            return ngx.exit(ngx.HTTP_FORBIDDEN)
+        end
+        return
+    end
+
+    if method ~= "DELETE" then
+        return
+    end
+
+    local path = ngx.var.request_filename:gsub("/+$", "")
+    if is_dir(path) ~= (uri:byte(-1) == 47) then
+        -- A collection without its trailing slash or a file with one: the
+        -- dav module answers 409 Conflict
+        return
+    end
+
+    local target
+    if in_trash(uri) then
+        -- Removing something from the trash for good is queued as well
+        target = trash_dir .. ".purging." .. unique_name()
+    elseif #path <= #root or path:sub(1, #root) ~= root then
+        -- The volume root itself cannot be renamed
+        return
+    else
+        target = trash_dir .. unique_name() .. "~" .. ngx.escape_uri(path:sub(#root + 1))
+    end
+
+    if not os_rename(path, target) then
+        -- Missing target, name too long for the trash or a nested mount:
+        -- leave it to the dav module, which reports or deletes it itself
+        return
+    end
+
+    return ngx.exit(ngx.HTTP_NO_CONTENT)
+end
+
+return _M
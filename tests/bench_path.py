@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+WebDAV Path Normalization Micro-Benchmark
+
+Measures the per-request overhead of lua/webdav_path.lua inside a real
+nginx worker, next to the string.match Destination fix it replaced.
+
+- Build Docker image with a temporary name
+- Run nginx with tests/bench_path.conf instead of the WebDAV configuration
+- Fetch /bench, which times each case in a loop and reports ns/op
+- Clean up container and image
+
+Usage: python3 tests/bench_path.py [iterations]
+"""
+
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+from test_webdav import Colors
+
+
+def main():
+    """Main entry point"""
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    project_root = Path(__file__).resolve().parent.parent
+    image_name = f"webdav-bench-{int(time.time())}"
+    container_name = image_name
+    port = random.randint(9000, 9900)
+
+    try:
+        print(f"{Colors.HEADER}Building Docker image: {image_name}{Colors.ENDC}")
+        subprocess.run(["docker", "build", "-t", image_name, str(project_root)],
+                       check=True, capture_output=True)
+
+        subprocess.run([
+            "docker", "run", "-d",
+            "--name", container_name,
+            "-p", f"{port}:8080",
+            "-v", f"{project_root / 'tests' / 'bench_path.conf'}:/etc/nginx/bench.conf:ro",
+            "--entrypoint", "nginx",
+            image_name,
+            "-c", "/etc/nginx/bench.conf", "-g", "daemon off;"
+        ], check=True, capture_output=True)
+
+        # Wait for nginx to be ready
+        time.sleep(2)
+
+        print(f"{Colors.HEADER}Running {iterations} iterations per case{Colors.ENDC}")
+        response = requests.get(f"http://localhost:{port}/bench",
+                                params={"n": iterations}, timeout=600)
+        response.raise_for_status()
+        print(f"{Colors.OKGREEN}{response.text}{Colors.ENDC}", end="")
+        print("(the uncached case includes building a distinct Destination per iteration)")
+        return 0
+    except (subprocess.CalledProcessError, requests.RequestException) as e:
+        print(f"{Colors.FAIL}Benchmark failed: {e}{Colors.ENDC}")
+        logs = subprocess.run(["docker", "logs", container_name],
+                              capture_output=True, text=True)
+        print(logs.stdout, logs.stderr)
+        return 1
+    finally:
+        subprocess.run(["docker", "rm", "-f", container_name], capture_output=True)
+        subprocess.run(["docker", "rmi", "-f", image_name], capture_output=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
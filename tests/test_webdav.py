@@ -29,6 +29,7 @@ import shutil
 import tempfile
 import random
 import subprocess
+import urllib.parse
 import requests
 from requests.auth import HTTPBasicAuth
 from pathlib import Path
@@ -103,7 +104,7 @@ class WebDAVTest:
             self.log(f"✗ Failed to create temp directory: {e}", Colors.FAIL)
             raise
     
-    def run_container(self, puid, pgid, port):
+    def run_container(self, puid, pgid, port, extra_env=None):
         """Run Docker container with specific PUID/PGID"""
         container_name = f"webdav-test-{puid}-{pgid}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
         
@@ -129,8 +130,10 @@ class WebDAVTest:
                 "-e", "WEBDAV_USERNAME=admin",
                 "-e", "WEBDAV_PASSWORD=admin123",
                 "-v", f"{self.temp_dir}:/var/www/webdav",
-                self.image_name
             ]
+            for key, value in (extra_env or {}).items():
+                cmd += ["-e", f"{key}={value}"]
+            cmd.append(self.image_name)
             
             result = subprocess.run(cmd, check=True, capture_output=True, text=True)
             container_id = result.stdout.strip()
@@ -202,6 +205,50 @@ class WebDAVTest:
             self.log(f"  ✗ Move request failed: {e}", Colors.FAIL)
             return False
     
+    def delete_webdav_path(self, port, path):
+        """Delete file or collection via WebDAV HTTP DELETE request"""
+        url = f"http://localhost:{port}/webdav/{path}"
+        auth = HTTPBasicAuth("admin", "admin123")
+        
+        try:
+            response = requests.delete(url, auth=auth, timeout=10)
+            if response.status_code in [200, 204]:
+                self.log(f"  ✓ Deleted via WebDAV: {path}", Colors.OKGREEN)
+                return True
+            else:
+                self.log(f"  ✗ Failed to delete: HTTP {response.status_code}", Colors.FAIL)
+                return False
+        except Exception as e:
+            self.log(f"  ✗ Delete request failed: {e}", Colors.FAIL)
+            return False
+    
+    def get_webdav_file(self, port, filename):
+        """Fetch file content via WebDAV HTTP GET request"""
+        url = f"http://localhost:{port}/webdav/{filename}"
+        auth = HTTPBasicAuth("admin", "admin123")
+        
+        try:
+            response = requests.get(url, auth=auth, timeout=10)
+            if response.status_code == 200:
+                return response.text
+            self.log(f"  ✗ Failed to get file: HTTP {response.status_code}", Colors.FAIL)
+            return None
+        except Exception as e:
+            self.log(f"  ✗ Get request failed: {e}", Colors.FAIL)
+            return None
+    
+    def get_cache_status(self, port):
+        """Fetch micro-cache counters as a dict"""
+        url = f"http://localhost:{port}/cache-status"
+        auth = HTTPBasicAuth("admin", "admin123")
+        
+        response = requests.get(url, auth=auth, timeout=10)
+        status = {}
+        for line in response.text.strip().split('\n'):
+            key, _, value = line.partition(': ')
+            status[key] = value
+        return status
+    
     def show_container_logs(self, container_name, tail=20):
         """Show recent container logs"""
         try:
@@ -603,6 +650,438 @@ class WebDAVTest:
         })
         return True
     
+    def test_micro_cache(self, puid, pgid, port, trash=False):
+        """Test small files are served from the micro-cache and invalidated on writes"""
+        label = "MICRO-CACHE, TRASH" if trash else "MICRO-CACHE"
+        self.log(f"\n{'='*60}", Colors.HEADER)
+        self.log(f"TEST CASE ({label}): PUID={puid}, PGID={pgid}", Colors.HEADER)
+        self.log(f"{'='*60}", Colors.HEADER)
+        
+        extra_env = {"CACHE_SIZE": "1m"}
+        if trash:
+            # The trash ends DELETE requests itself in the access phase
+            extra_env["TRASH_ENABLED"] = "true"
+        success, container_name, _ = self.run_container(
+            puid, pgid, port, extra_env=extra_env)
+        if not success:
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Container failed to start (MICRO-CACHE test)'
+            })
+            return False
+        
+        # Wait for WebDAV service to be ready
+        time.sleep(2)
+        
+        filename = f"cached_{puid}_{pgid}.txt"
+        
+        if not self.create_webdav_file(port, filename, "version 1"):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to create file for MICRO-CACHE test'
+            })
+            return False
+        
+        # First GET fills the cache, second one must be a hit
+        first = self.get_webdav_file(port, filename)
+        second = self.get_webdav_file(port, filename)
+        status = self.get_cache_status(port)
+        self.log(f"  Cache status: {status}")
+        if first != "version 1" or second != "version 1" or int(status.get('hits', 0)) < 1:
+            self.show_container_logs(container_name)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Second GET was not served from the micro-cache'
+            })
+            return False
+        
+        self.log(f"  ✓ Second GET served from cache", Colors.OKGREEN)
+
+        # Cached responses must still support revalidation
+        url = f"http://localhost:{port}/webdav/{filename}"
+        auth = HTTPBasicAuth("admin", "admin123")
+        etag = requests.get(url, auth=auth, timeout=10).headers.get('ETag')
+        response = requests.get(url, auth=auth, headers={'If-None-Match': etag or ''}, timeout=10)
+        if not etag or response.status_code != 304:
+            self.log(f"  ✗ Revalidation got HTTP {response.status_code}, ETag={etag}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Cached file did not answer If-None-Match with 304'
+            })
+            return False
+
+        self.log(f"  ✓ Conditional GET answered with 304", Colors.OKGREEN)
+
+        # PUT must invalidate the cached body
+        if not self.create_webdav_file(port, filename, "version 2"):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to overwrite file for MICRO-CACHE test'
+            })
+            return False
+        
+        content = self.get_webdav_file(port, filename)
+        if content != "version 2":
+            self.log(f"  ✗ Stale content after PUT: {content!r}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Micro-cache served stale content after PUT'
+            })
+            return False
+        
+        self.log(f"  ✓ Cache invalidated by PUT", Colors.OKGREEN)
+        
+        # COPY and MOVE must invalidate a cached Destination
+        for method in ["COPY", "MOVE"]:
+            source = f"{method.lower()}_{filename}"
+            if not self.create_webdav_file(port, source, f"{method} body"):
+                self.test_results.append({
+                    'puid': puid,
+                    'pgid': pgid,
+                    'status': 'FAILED',
+                    'reason': f'Failed to create {method} source for MICRO-CACHE test'
+                })
+                return False
+            
+            self.get_webdav_file(port, filename)
+            response = requests.request(method, f"http://localhost:{port}/webdav/{source}",
+                                        headers={'Destination': url, 'Overwrite': 'T'},
+                                        auth=auth, timeout=10)
+            content = self.get_webdav_file(port, filename)
+            if response.status_code not in [201, 204] or content != f"{method} body":
+                self.log(f"  ✗ {method} got HTTP {response.status_code}, "
+                         f"Destination serves {content!r}", Colors.FAIL)
+                self.test_results.append({
+                    'puid': puid,
+                    'pgid': pgid,
+                    'status': 'FAILED',
+                    'reason': f'Micro-cache served stale Destination after {method}'
+                })
+                return False
+            
+            self.log(f"  ✓ Cache invalidated by {method}", Colors.OKGREEN)
+        
+        # DELETE must invalidate the cached body
+        self.get_webdav_file(port, filename)
+        if not self.delete_webdav_path(port, filename):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to delete file for MICRO-CACHE test'
+            })
+            return False
+        
+        response = requests.get(url, auth=auth, timeout=10)
+        if response.status_code != 404:
+            self.log(f"  ✗ GET after DELETE got HTTP {response.status_code}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Micro-cache served deleted file'
+            })
+            return False
+        
+        self.log(f"  ✓ Cache invalidated by DELETE", Colors.OKGREEN)
+        
+        self.test_results.append({
+            'puid': puid,
+            'pgid': pgid,
+            'status': 'PASSED',
+            'reason': 'Micro-cache hit and invalidation work correctly'
+        })
+        return True
+    
+    def test_trash_restore(self, puid, pgid, port):
+        """Test DELETE moves a collection to the trash and MOVE restores it"""
+        self.log(f"\n{'='*60}", Colors.HEADER)
+        self.log(f"TEST CASE (TRASH): PUID={puid}, PGID={pgid}", Colors.HEADER)
+        self.log(f"{'='*60}", Colors.HEADER)
+        
+        success, container_name, _ = self.run_container(
+            puid, pgid, port, extra_env={"TRASH_ENABLED": "true", "CACHE_SIZE": "1m"})
+        if not success:
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Container failed to start (TRASH test)'
+            })
+            return False
+        
+        # Wait for WebDAV service to be ready
+        time.sleep(2)
+        
+        collection = f"trash_{puid}_{pgid}"
+        filename = f"{collection}/file.txt"
+        collection_path = Path(self.temp_dir) / collection
+        trash_path = Path(self.temp_dir) / ".trash"
+        
+        if not self.create_webdav_file(port, filename, "Test file for TRASH"):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to create file for TRASH test'
+            })
+            return False
+        
+        # Fill the micro-cache with the child before deleting its collection
+        self.get_webdav_file(port, filename)
+        self.get_webdav_file(port, filename)
+        
+        # Like the dav module, refuse a collection named without its slash
+        # and a file named with one
+        auth = HTTPBasicAuth("admin", "admin123")
+        for path in [collection, f"{filename}/"]:
+            response = requests.delete(f"http://localhost:{port}/webdav/{path}",
+                                       auth=auth, timeout=10)
+            if response.status_code != 409 or not (collection_path / "file.txt").exists():
+                self.log(f"  ✗ DELETE {path} got HTTP {response.status_code}", Colors.FAIL)
+                self.test_results.append({
+                    'puid': puid,
+                    'pgid': pgid,
+                    'status': 'FAILED',
+                    'reason': f'DELETE of mismatched path {path!r} was not refused with 409'
+                })
+                return False
+        
+        self.log(f"  ✓ Mismatched trailing slashes refused with 409", Colors.OKGREEN)
+        
+        if not self.delete_webdav_path(port, f"{collection}/"):
+            self.show_container_logs(container_name)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'WebDAV DELETE failed with trash enabled'
+            })
+            return False
+        
+        response = requests.get(f"http://localhost:{port}/webdav/{filename}",
+                                auth=auth, timeout=10)
+        if response.status_code != 404:
+            self.log(f"  ✗ GET of deleted child got HTTP {response.status_code}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Micro-cache served a file of a deleted collection'
+            })
+            return False
+        
+        entries = [e for e in os.listdir(trash_path) if e.endswith(f"~{collection}")]
+        if collection_path.exists() or len(entries) != 1:
+            self.log(f"  ✗ Collection was not moved to the trash: {entries}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'DELETE did not move the collection to the trash'
+            })
+            return False
+        
+        self.log(f"  ✓ Collection moved to trash: {entries[0]}", Colors.OKGREEN)
+        
+        # Restore with a plain MOVE out of the trash
+        trash_entry = f".trash/{urllib.parse.quote(entries[0])}/"
+        if not self.move_webdav_file(port, trash_entry, f"{collection}/"):
+            self.show_container_logs(container_name)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to restore collection from the trash'
+            })
+            return False
+        
+        if not (collection_path / "file.txt").exists():
+            self.log(f"  ✗ Restored file does not exist", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Restored collection is missing its file'
+            })
+            return False
+        
+        self.log(f"  ✓ Collection restored from trash", Colors.OKGREEN)
+        
+        self.test_results.append({
+            'puid': puid,
+            'pgid': pgid,
+            'status': 'PASSED',
+            'reason': 'DELETE to trash and restore work correctly'
+        })
+        return True
+    
+    def test_destination_normalization(self, puid, pgid, port):
+        """Test MOVE with percent-encoded and unsafe Destination headers"""
+        self.log(f"\n{'='*60}", Colors.HEADER)
+        self.log(f"TEST CASE (DESTINATION): PUID={puid}, PGID={pgid}", Colors.HEADER)
+        self.log(f"{'='*60}", Colors.HEADER)
+        
+        success, container_name, _ = self.run_container(puid, pgid, port)
+        if not success:
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Container failed to start (DESTINATION test)'
+            })
+            return False
+        
+        # Wait for WebDAV service to be ready
+        time.sleep(2)
+        
+        source_file = "dest source.txt"
+        dest_file = "dest moved+1.txt"
+        
+        if not self.create_webdav_file(port, urllib.parse.quote(source_file), "Test for Destination"):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to create file for DESTINATION test'
+            })
+            return False
+        
+        # Percent-encoded Destination with "." segments must land on the decoded name
+        if not self.move_webdav_file(port, urllib.parse.quote(source_file),
+                                     f"./{urllib.parse.quote(dest_file)}"):
+            self.show_container_logs(container_name)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'MOVE with percent-encoded Destination failed'
+            })
+            return False
+        
+        if not (Path(self.temp_dir) / dest_file).exists():
+            self.log(f"  ✗ File '{dest_file}' does not exist after move", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Percent-encoded Destination was not decoded'
+            })
+            return False
+        
+        self.log(f"  ✓ File '{dest_file}' exists", Colors.OKGREEN)
+        
+        # A Destination escaping /webdav must be rejected
+        url = f"http://localhost:{port}/webdav/{urllib.parse.quote(dest_file)}"
+        headers = {'Destination': f"http://localhost:{port}/webdav/../escape.txt"}
+        response = requests.request('MOVE', url, headers=headers,
+                                    auth=HTTPBasicAuth("admin", "admin123"), timeout=10)
+        if response.status_code != 400:
+            self.log(f"  ✗ Unsafe Destination got HTTP {response.status_code}", Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Destination escaping /webdav was not rejected'
+            })
+            return False
+        
+        self.log(f"  ✓ Unsafe Destination rejected", Colors.OKGREEN)
+        
+        self.test_results.append({
+            'puid': puid,
+            'pgid': pgid,
+            'status': 'PASSED',
+            'reason': 'Destination normalization works correctly'
+        })
+        return True
+    
+    def test_public_prefix(self, puid, pgid, port):
+        """Test Destination headers under PUBLIC_PREFIX map back to /webdav"""
+        self.log(f"\n{'='*60}", Colors.HEADER)
+        self.log(f"TEST CASE (PUBLIC_PREFIX): PUID={puid}, PGID={pgid}", Colors.HEADER)
+        self.log(f"{'='*60}", Colors.HEADER)
+        
+        success, container_name, _ = self.run_container(
+            puid, pgid, port, extra_env={"PUBLIC_PREFIX": "/dav"})
+        if not success:
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Container failed to start (PUBLIC_PREFIX test)'
+            })
+            return False
+        
+        # Wait for WebDAV service to be ready
+        time.sleep(2)
+        
+        source_file = "prefix_source.txt"
+        dest_file = "prefix_moved.txt"
+        url = f"http://localhost:{port}/webdav/{source_file}"
+        auth = HTTPBasicAuth("admin", "admin123")
+        
+        if not self.create_webdav_file(port, source_file, "Test for PUBLIC_PREFIX"):
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Failed to create file for PUBLIC_PREFIX test'
+            })
+            return False
+        
+        # A Destination outside both /dav and /webdav must be rejected
+        headers = {'Destination': f"https://localhost:{port}/other/{dest_file}"}
+        response = requests.request('MOVE', url, headers=headers, auth=auth, timeout=10)
+        if response.status_code != 400:
+            self.log(f"  ✗ Destination outside the prefix got HTTP {response.status_code}",
+                     Colors.FAIL)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Destination outside PUBLIC_PREFIX was not rejected'
+            })
+            return False
+        
+        self.log(f"  ✓ Destination outside the prefix rejected", Colors.OKGREEN)
+        
+        # A reverse proxy exposes /webdav as /dav, so clients send that
+        headers = {'Destination': f"https://localhost:{port}/dav/{dest_file}"}
+        response = requests.request('MOVE', url, headers=headers, auth=auth, timeout=10)
+        if response.status_code not in [201, 204] or not (Path(self.temp_dir) / dest_file).exists():
+            self.log(f"  ✗ MOVE to /dav/{dest_file} got HTTP {response.status_code}", Colors.FAIL)
+            self.show_container_logs(container_name)
+            self.test_results.append({
+                'puid': puid,
+                'pgid': pgid,
+                'status': 'FAILED',
+                'reason': 'Destination under PUBLIC_PREFIX was not mapped to /webdav'
+            })
+            return False
+        
+        self.log(f"  ✓ File '{dest_file}' exists", Colors.OKGREEN)
+        
+        self.test_results.append({
+            'puid': puid,
+            'pgid': pgid,
+            'status': 'PASSED',
+            'reason': 'PUBLIC_PREFIX Destination mapping works correctly'
+        })
+        return True
+    
     def cleanup(self):
         """Clean up containers, image, and temporary directory"""
         self.log(f"\n{'='*60}", Colors.HEADER)
@@ -697,6 +1176,11 @@ class WebDAVTest:
             self.test_move_operation(1000, 1000, base_port + 3)
             self.test_simple_rename(1000, 1000, base_port + 4)
             self.test_https_destination_header(1000, 1000, base_port + 5)
+            self.test_micro_cache(1000, 1000, base_port + 6)
+            self.test_trash_restore(1000, 1000, base_port + 7)
+            self.test_destination_normalization(1000, 1000, base_port + 8)
+            self.test_micro_cache(1000, 1000, base_port + 9, trash=True)
+            self.test_public_prefix(1000, 1000, base_port + 10)
             
             all_passed = self.print_summary()
             return all_passed
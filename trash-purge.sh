@@ -0,0 +1,83 @@
+#!/bin/sh
+
+# Background purge of the WebDAV trash (see lua/webdav_trash.lua).
+# Entries are named "<deleted-at>.<host>.<pid>.<seq>~<original path>";
+# entries deleted from the trash by a client are renamed to ".purging.*".
+#
+# Each pass claims expired and ".purging.*" entries by renaming them into
+# this host's work directory, so replicas sharing a volume never delete
+# the same entry twice. The work directory is then emptied in slices of
+# TRASH_PURGE_SLICE seconds separated by TRASH_PURGE_PAUSE seconds, at
+# idle I/O priority where ionice is available. Deletion speed is bounded
+# by time rather than by entries, so neither one huge collection nor many
+# small files can monopolize the volume or fall behind without bound.
+#
+# A recreated container gets a new host name, so the work directory of
+# the old one would never be emptied. Work directories are touched while
+# in use, and one left untouched for over ten purge intervals is taken
+# over by renaming it into this host's own; only one replica wins.
+
+TRASH_DIR=${TRASH_DIR:-/var/www/webdav/.trash}
+TRASH_RETENTION=${TRASH_RETENTION:-604800}
+TRASH_PURGE_INTERVAL=${TRASH_PURGE_INTERVAL:-60}
+TRASH_PURGE_SLICE=${TRASH_PURGE_SLICE:-1}
+TRASH_PURGE_PAUSE=${TRASH_PURGE_PAUSE:-4}
+STALE_AGE=$((TRASH_PURGE_INTERVAL * 10 + 60))
+
+WORK_DIR="$TRASH_DIR/.purge-$(hostname)"
+
+LOW_PRIORITY="nice -n 19"
+if command -v ionice >/dev/null 2>&1; then
+    LOW_PRIORITY="ionice -c 3 $LOW_PRIORITY"
+fi
+
+# Move an entry into the work directory; fails if another replica won
+claim() {
+    mv "$1" "$WORK_DIR/${1##*/}" 2>/dev/null
+}
+
+# Empty and remove the work directory, one time slice at a time.
+# Interrupting "find -delete" leaves a smaller but still valid tree.
+purge_work_dir() {
+    until rmdir "$WORK_DIR" 2>/dev/null; do
+        [ -d "$WORK_DIR" ] || return
+        touch "$WORK_DIR"
+        timeout "$TRASH_PURGE_SLICE" $LOW_PRIORITY \
+            find "$WORK_DIR" -mindepth 1 -depth -delete 2>/dev/null
+        sleep "$TRASH_PURGE_PAUSE"
+    done
+}
+
+while true; do
+    now=$(date +%s)
+    # Also picks up what a previous shutdown left unfinished
+    mkdir -p "$WORK_DIR"
+    touch "$WORK_DIR"
+
+    for entry in "$TRASH_DIR"/.purge-*; do
+        [ -d "$entry" ] && [ "$entry" != "$WORK_DIR" ] || continue
+        touched=$(stat -c %Y "$entry" 2>/dev/null) || continue
+        [ $((now - touched)) -ge "$STALE_AGE" ] && claim "$entry"
+    done
+
+    for entry in "$TRASH_DIR"/.purging.*; do
+        [ -e "$entry" ] && claim "$entry"
+    done
+
+    # Names start with the deletion time, so the glob yields oldest first
+    for entry in "$TRASH_DIR"/*; do
+        [ -e "$entry" ] || continue
+
+        name=${entry##*/}
+        deleted_at=${name%%.*}
+        case "$deleted_at" in
+            ''|*[!0-9]*) continue ;;
+        esac
+        [ $((now - deleted_at)) -ge "$TRASH_RETENTION" ] || break
+
+        claim "$entry"
+    done
+
+    purge_work_dir
+    sleep "$TRASH_PURGE_INTERVAL"
+done